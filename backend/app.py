@@ -56,6 +56,10 @@ class QuotaManager:
             return True
         return False
     
+    def refund_credit(self):
+        if self.used > 0:
+            self.used -= 1
+    
     def get_status(self):
         return {
             "used": self.used,
@@ -125,8 +129,8 @@ def _guess_content_type(filename: Optional[str], media_type: str) -> str:
             return guessed
     return "video/mp4" if media_type == "video" else "image/jpeg"
 
-def _call_ai_detection_api(media_bytes: bytes, media_type: str, filename: Optional[str]) -> dict:
-    """Call AI or Not API with multipart media bytes."""
+def _build_ai_detection_request(media_bytes: bytes, media_type: str, filename: Optional[str]) -> Tuple[str, dict, dict]:
+    """Build (endpoint, files, headers) for an AI or Not multipart request."""
     endpoint = AI_OR_NOT_VIDEO_API_URL if media_type == "video" else AI_OR_NOT_IMAGE_API_URL
     field_name = "video" if media_type == "video" else "image"
     effective_name = filename or ("upload.mp4" if media_type == "video" else "upload.jpg")
@@ -145,10 +149,23 @@ def _call_ai_detection_api(media_bytes: bytes, media_type: str, filename: Option
         f"[AIFD][AIORNOT] request endpoint={endpoint} media_type={media_type} "
         f"filename={effective_name} bytes={len(media_bytes)}"
     )
+    key_preview = f"{AI_OR_NOT_API_KEY[:4]}...{AI_OR_NOT_API_KEY[-4:]}"
+    print(f"[DEBUG] Using Key: {key_preview} (Length: {len(AI_OR_NOT_API_KEY)})")
+
+    return endpoint, files, headers
+
+def _log_ai_detection_response(status_code: int, text: str, media_type: str) -> None:
+    body_preview = text[:500] if text else ""
+    print(
+        f"[AIFD][AIORNOT] response status={status_code} "
+        f"media_type={media_type} body_preview={body_preview!r}"
+    )
+
+def _call_ai_detection_api(media_bytes: bytes, media_type: str, filename: Optional[str]) -> dict:
+    """Call AI or Not API with multipart media bytes."""
+    endpoint, files, headers = _build_ai_detection_request(media_bytes, media_type, filename)
 
     try:
-        key_preview = f"{AI_OR_NOT_API_KEY[:4]}...{AI_OR_NOT_API_KEY[-4:]}"
-        print(f"[DEBUG] Using Key: {key_preview} (Length: {len(AI_OR_NOT_API_KEY)})")
         response = requests.post(endpoint, files=files, headers=headers, timeout=60)
     except requests.Timeout as exc:
         print(f"[AIFD][AIORNOT] timeout media_type={media_type}: {exc}")
@@ -157,11 +174,7 @@ def _call_ai_detection_api(media_bytes: bytes, media_type: str, filename: Option
         print(f"[AIFD][AIORNOT] network error media_type={media_type}: {exc}")
         raise
 
-    body_preview = response.text[:500] if response.text else ""
-    print(
-        f"[AIFD][AIORNOT] response status={response.status_code} "
-        f"media_type={media_type} body_preview={body_preview!r}"
-    )
+    _log_ai_detection_response(response.status_code, response.text, media_type)
 
     response.raise_for_status()
     return response.json()
@@ -220,11 +233,91 @@ def trim_video(input_path, max_duration=15):
     with VideoFileClip(input_path) as video:
         # If video is longer than our limit, cut it
         if video.duration > max_duration:
-            new_video = video.subclip(0, max_duration)
+            new_video = video.subclipped(0, max_duration)
             new_video.write_videofile(output_path, codec="libx264", audio=True)
             return output_path
     return input_path
 
+def _trim_video_bytes(media_bytes: bytes, max_duration: int = 5) -> bytes:
+    """Re-encode the first max_duration seconds of a video and return the new bytes."""
+    _ensure_upload_dir()
+    with tempfile.NamedTemporaryFile(suffix=".mp4", delete=False, dir=UPLOAD_DIR) as tmp_in:
+        tmp_in.write(media_bytes)
+        input_path = tmp_in.name
+
+    output_path = input_path.replace(".mp4", "_trimmed.mp4")
+
+    try:
+        with VideoFileClip(input_path) as video:
+            # Clip to 5 seconds to speed up AI detection and save bandwidth
+            duration = min(max_duration, video.duration)
+            trimmed = video.subclipped(0, duration)
+            # Using ultrafast to keep server response snappy
+            trimmed.write_videofile(output_path, codec="libx264", audio=False, logger=None, preset="ultrafast")
+
+        return Path(output_path).read_bytes()
+    finally:
+        if os.path.exists(input_path): os.remove(input_path)
+        if os.path.exists(output_path): os.remove(output_path)
+
+def _parse_detect_payload(payload: dict) -> Tuple[Optional[str], Optional[str], Optional[str], bool]:
+    """
+    Pull (video_data, image_base64, media_url, is_video_type) out of a /detect body.
+    Priority: video_data (Blob) > base64 (Image) > media_url (Fallback/Poster)
+    """
+    video_data = payload.get("video_data")
+    image_base64 = payload.get("base64") or payload.get("image")
+    media_url = payload.get("media_url") or payload.get("url")
+    is_video_type = bool(payload.get("isVideo") or payload.get("media_type") == "video")
+    return video_data, image_base64, media_url, is_video_type
+
+def _decode_inline_media(video_data: Optional[str], image_base64: Optional[str]) -> Tuple[bytes, str, bool]:
+    """Decode base64 media from the request body into (bytes, filename, is_video)."""
+    # A) Handle Video Blob Bytes (The primary "Friend's Computer" fix)
+    if video_data:
+        return base64.b64decode(video_data), "blob_video.mp4", True
+
+    # B) Handle Image Base64 (The "Canvas" capture)
+    if "," in image_base64:
+        image_base64 = image_base64.split(',', 1)[1]
+    return base64.b64decode(image_base64), "canvas_capture.jpg", False # It's a captured frame/thumbnail
+
+def _should_trim_video(is_video_type: bool, source_filename: str) -> bool:
+    # We only trim if it's actually a video file, not a poster image URL.
+    return is_video_type and source_filename.endswith(('.mp4', '.webm', '.mov', 'video_blob.mp4'))
+
+def _build_detect_result(is_ai: bool, confidence: float, is_nsfw: bool, media_hash: str, is_video_type: bool) -> dict:
+    # Response Construction (Matches your Mock structure)
+    return {
+        "ok": True,
+        "is_ai": is_ai,
+        "confidence": confidence,
+        "nsfw": is_nsfw,
+        "hash": media_hash,
+        "media_type": "video" if is_video_type else "image",
+        "quota": quota_manager.get_status()
+    }
+
+# Strict prompt for deliberation, shared by the sync and async NSFW checks
+NSFW_PROMPT = (
+    "Analyze this content carefully. Check for explicit nudity, graphic violence, "
+    "or highly suggestive sexual content. Deliberate internally on whether this "
+    "violates standard 'Safe for Work' guidelines. "
+    "Respond ONLY with the word 'true' if it is NSFW (unsafe) or 'false' if it is SFW (safe)."
+)
+GEMINI_VIDEO_MODEL = "gemini-2.0-flash"
+GEMINI_IMAGE_MODEL = "gemini-3-flash-preview"
+
+def _write_temp_video(media_bytes: bytes) -> str:
+    with tempfile.NamedTemporaryFile(suffix=".mp4", delete=False) as tmp:
+        tmp.write(media_bytes)
+        return tmp.name
+
+def _parse_nsfw_verdict(response_text: str) -> bool:
+    result_text = response_text.strip().lower()
+    print(f"[AIFD][GEMINI] NSFW Analysis: {result_text}")
+    return "true" in result_text
+
 def _check_nsfw_with_gemini(media_bytes: bytes, media_type: str) -> bool:
     """
     Uses Gemini to determine if content is NSFW.
@@ -234,44 +327,31 @@ def _check_nsfw_with_gemini(media_bytes: bytes, media_type: str) -> bool:
         print("[AIFD][GEMINI] Skip: No API Key")
         return False
 
-    # Define the strict prompt for deliberation
-    nsfw_prompt = (
-        "Analyze this content carefully. Check for explicit nudity, graphic violence, "
-        "or highly suggestive sexual content. Deliberate internally on whether this "
-        "violates standard 'Safe for Work' guidelines. "
-        "Respond ONLY with the word 'true' if it is NSFW (unsafe) or 'false' if it is SFW (safe)."
-    )
-
     try:
         mime_type = "video/mp4" if media_type == "video" else "image/jpeg"
         
         # For videos, we use the Upload API as suggested by docs
         if media_type == "video":
-            with tempfile.NamedTemporaryFile(suffix=".mp4", delete=False) as tmp:
-                tmp.write(media_bytes)
-                tmp_path = tmp.name
+            tmp_path = _write_temp_video(media_bytes)
             
             # Upload to Gemini
             myfile = gemini_client.files.upload(file=tmp_path)
             response = gemini_client.models.generate_content(
-                model="gemini-2.0-flash", 
-                contents=[myfile, nsfw_prompt]
+                model=GEMINI_VIDEO_MODEL, 
+                contents=[myfile, NSFW_PROMPT]
             )
             os.remove(tmp_path) # Clean up
         else:
             # For images, we send bytes directly
             response = gemini_client.models.generate_content(
-                model='gemini-3-flash-preview',
+                model=GEMINI_IMAGE_MODEL,
                 contents=[
                     types.Part.from_bytes(data=media_bytes, mime_type=mime_type),
-                    nsfw_prompt
+                    NSFW_PROMPT
                 ]
             )
 
-        result_text = response.text.strip().lower()
-        print(f"[AIFD][GEMINI] NSFW Analysis: {result_text}")
-        
-        return "true" in result_text
+        return _parse_nsfw_verdict(response.text)
     except Exception as e:
         print(f"[AIFD][GEMINI] Error: {str(e)}")
         return False
@@ -317,28 +397,13 @@ def detect_image():
         payload = request.get_json(silent=True) or {}
         
         # 1. Identify Content Type & Source
-        # Priority: video_data (Blob) > base64 (Image) > media_url (Fallback/Poster)
-        video_data = payload.get("video_data")
-        image_base64 = payload.get("base64") or payload.get("image")
-        media_url = payload.get("media_url") or payload.get("url")
-        is_video_type = payload.get("isVideo") or payload.get("media_type") == "video"
+        video_data, image_base64, media_url, is_video_type = _parse_detect_payload(payload)
 
         media_bytes = None
         source_filename = "upload.jpg"
 
-        # A) Handle Video Blob Bytes (The primary "Friend's Computer" fix)
-        if video_data:
-            media_bytes = base64.b64decode(video_data)
-            source_filename = "blob_video.mp4"
-            is_video_type = True
-        
-        # B) Handle Image Base64 (The "Canvas" capture)
-        elif image_base64:
-            if "," in image_base64:
-                image_base64 = image_base64.split(',', 1)[1]
-            media_bytes = base64.b64decode(image_base64)
-            source_filename = "canvas_capture.jpg"
-            is_video_type = False # It's a captured frame/thumbnail
+        if video_data or image_base64:
+            media_bytes, source_filename, is_video_type = _decode_inline_media(video_data, image_base64)
 
         # C) Handle URL (The "My Computer" or "Poster" fallback)
         elif media_url:
@@ -366,27 +431,8 @@ def detect_image():
             return jsonify({"ok": False, "error": "Quota reached", "quota": quota_manager.get_status()}), 429
 
         # 4. Video Trimming (First 5 Seconds Only)
-        # We only trim if it's actually a video file, not a poster image URL.
-        if is_video_type and source_filename.endswith(('.mp4', '.webm', '.mov', 'video_blob.mp4')):
-            _ensure_upload_dir()
-            with tempfile.NamedTemporaryFile(suffix=".mp4", delete=False, dir=UPLOAD_DIR) as tmp_in:
-                tmp_in.write(media_bytes)
-                input_path = tmp_in.name
-            
-            output_path = input_path.replace(".mp4", "_trimmed.mp4")
-            
-            try:
-                with VideoFileClip(input_path) as video:
-                    # Clip to 5 seconds to speed up AI detection and save bandwidth
-                    duration = min(5, video.duration)
-                    trimmed = video.subclip(0, duration)
-                    # Using ultrafast to keep server response snappy
-                    trimmed.write_videofile(output_path, codec="libx264", audio=False, logger=None, preset="ultrafast")
-                
-                media_bytes = Path(output_path).read_bytes()
-            finally:
-                if os.path.exists(input_path): os.remove(input_path)
-                if os.path.exists(output_path): os.remove(output_path)
+        if _should_trim_video(is_video_type, source_filename):
+            media_bytes = _trim_video_bytes(media_bytes)
 
         # 5. Execute AI Detection
         api_response = _call_ai_detection_api(media_bytes, "video" if is_video_type else "image", source_filename)
@@ -395,16 +441,8 @@ def detect_image():
 
         is_nsfw = _check_nsfw_with_gemini(media_bytes, "video" if is_video_type else "image")
 
-        # 6. Response Construction (Matches your Mock structure)
-        result = {
-            "ok": True,
-            "is_ai": is_ai,
-            "confidence": confidence,
-            "nsfw": is_nsfw,
-            "hash": media_hash,
-            "media_type": "video" if is_video_type else "image",
-            "quota": quota_manager.get_status()
-        }
+        # 6. Response Construction
+        result = _build_detect_result(is_ai, confidence, is_nsfw, media_hash, is_video_type)
 
         # Cache with 24h TTL logic
         cache[media_hash] = {"result": result, "timestamp": _utc_now_iso()}
@@ -0,0 +1,293 @@
+"""
+Asyncio-native serving mode for the detection backend.
+
+Serves /detect, /quota, /health and /cache/* on an event loop (Quart + Hypercorn)
+so in-flight AI or Not / URL fetches don't each pin an OS thread. Shares the quota
+manager, cache and helpers with app.py, so the JSON contract is identical.
+
+Run with:  hypercorn async_app:app --bind 0.0.0.0:3500
+"""
+import asyncio
+import json
+import os
+import tempfile
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from pathlib import Path
+from typing import List, Optional, Tuple
+
+import httpx
+from google.genai import types
+from quart import Quart, jsonify, request
+from quart_cors import cors
+
+from app import (
+    AI_OR_NOT_API_KEY,
+    GEMINI_IMAGE_MODEL,
+    GEMINI_VIDEO_MODEL,
+    NSFW_PROMPT,
+    _build_ai_detection_request,
+    _build_detect_result,
+    _decode_inline_media,
+    _log_ai_detection_response,
+    _normalize_aiornot_response,
+    _parse_detect_payload,
+    _parse_nsfw_verdict,
+    _sha256_bytes,
+    _should_trim_video,
+    _trim_video_bytes,
+    _utc_now_iso,
+    _write_temp_video,
+    cache,
+    gemini_client,
+    quota_manager,
+)
+
+# Upper bound on concurrent upstream connections across all requests
+HTTP_MAX_CONNECTIONS = int(os.getenv("HTTP_MAX_CONNECTIONS", "200"))
+# Processes for JSON parsing and base64 decoding: json.loads and b64decode hold the
+# GIL for the whole call, so running them on a thread would still stall the loop
+DECODE_WORKERS = int(os.getenv("DECODE_WORKERS", str(os.cpu_count() or 4)))
+# Threads for sha256, temp-file writes and ffmpeg trimming, which release the GIL.
+# Each libx264 encode is already multi-threaded, so half the cores is enough
+MEDIA_WORKERS = int(os.getenv("MEDIA_WORKERS", str(max(2, (os.cpu_count() or 4) // 2))))
+
+decode_executor = ProcessPoolExecutor(max_workers=DECODE_WORKERS)
+media_executor = ThreadPoolExecutor(max_workers=MEDIA_WORKERS, thread_name_prefix="aifd-media")
+
+app = Quart(__name__)
+app.config["MAX_CONTENT_LENGTH"] = 200 * 1024 * 1024
+app = cors(app, allow_origin="*")
+
+http_client: Optional[httpx.AsyncClient] = None
+
+@app.before_serving
+async def _open_http_client():
+    global http_client
+    http_client = httpx.AsyncClient(
+        follow_redirects=True,
+        limits=httpx.Limits(max_connections=HTTP_MAX_CONNECTIONS),
+    )
+
+@app.after_serving
+async def _close_http_client():
+    await http_client.aclose()
+
+async def _run_in(executor, func, *args):
+    return await asyncio.get_running_loop().run_in_executor(executor, func, *args)
+
+# Large payloads cross the process boundary as temp files rather than pickles:
+# pickling copies the whole buffer while holding the GIL, file I/O releases it.
+def _spool_chunks(chunks: List[bytes]) -> str:
+    with tempfile.NamedTemporaryFile(delete=False) as tmp:
+        tmp.writelines(chunks)
+        return tmp.name
+
+def _read_spooled(path: str) -> bytes:
+    try:
+        return Path(path).read_bytes()
+    finally:
+        os.remove(path)
+
+def _load_detect_body(body_path: str) -> Tuple[Optional[str], str, bool, Optional[str]]:
+    """
+    Runs in decode_executor. Parses a spooled /detect JSON body and decodes any
+    inline media into another spool file, returning
+    (media_path, source_filename, is_video_type, media_url).
+    """
+    try:
+        payload = json.loads(_read_spooled(body_path))
+    except ValueError:
+        payload = None  # get_json(silent=True) semantics
+
+    video_data, image_base64, media_url, is_video_type = _parse_detect_payload(payload or {})
+    if video_data or image_base64:
+        media_bytes, source_filename, is_video_type = _decode_inline_media(video_data, image_base64)
+        return _spool_chunks([media_bytes]), source_filename, is_video_type, None
+    return None, "upload.jpg", is_video_type, media_url
+
+async def _fetch_media_url(url: str) -> bytes:
+    resp = await http_client.get(url, timeout=20)
+    resp.raise_for_status()
+    return resp.content
+
+async def _call_ai_detection_api_async(media_bytes: bytes, media_type: str, filename: str) -> dict:
+    """Async twin of app._call_ai_detection_api."""
+    endpoint, files, headers = _build_ai_detection_request(media_bytes, media_type, filename)
+
+    try:
+        response = await http_client.post(endpoint, files=files, headers=headers, timeout=60)
+    except httpx.TimeoutException as exc:
+        print(f"[AIFD][AIORNOT] timeout media_type={media_type}: {exc}")
+        raise
+    except httpx.HTTPError as exc:
+        print(f"[AIFD][AIORNOT] network error media_type={media_type}: {exc}")
+        raise
+
+    _log_ai_detection_response(response.status_code, response.text, media_type)
+
+    response.raise_for_status()
+    return response.json()
+
+async def _check_nsfw_with_gemini_async(media_bytes: bytes, media_type: str) -> bool:
+    """Async twin of app._check_nsfw_with_gemini, awaited via the genai aio client."""
+    if not gemini_client:
+        print("[AIFD][GEMINI] Skip: No API Key")
+        return False
+
+    try:
+        # For videos, we use the Upload API as suggested by docs
+        if media_type == "video":
+            tmp_path = await _run_in(media_executor, _write_temp_video, media_bytes)
+            try:
+                myfile = await gemini_client.aio.files.upload(file=tmp_path)
+                response = await gemini_client.aio.models.generate_content(
+                    model=GEMINI_VIDEO_MODEL,
+                    contents=[myfile, NSFW_PROMPT]
+                )
+            finally:
+                os.remove(tmp_path)
+        else:
+            response = await gemini_client.aio.models.generate_content(
+                model=GEMINI_IMAGE_MODEL,
+                contents=[
+                    types.Part.from_bytes(data=media_bytes, mime_type="image/jpeg"),
+                    NSFW_PROMPT
+                ]
+            )
+
+        return _parse_nsfw_verdict(response.text)
+    except Exception as e:
+        print(f"[AIFD][GEMINI] Error: {str(e)}")
+        return False
+
+@app.get("/")
+async def root():
+    return jsonify(
+        {
+            "name": "ai-feed-detector-backend",
+            "status": "ok",
+            "timestamp": _utc_now_iso(),
+            "endpoints": {
+                "/detect": "POST - Analyze image for AI generation",
+                "/quota": "GET - Get quota usage",
+                "/health": "GET - Health check",
+                "/cache/info": "GET - Cache information"
+            }
+        }
+    )
+
+@app.get("/health")
+async def health():
+    return jsonify({
+        "ok": True,
+        "timestamp": _utc_now_iso(),
+        "quota": quota_manager.get_status(),
+        "cache_size": len(cache)
+    })
+
+@app.post("/detect")
+async def detect_image():
+    """
+    Same pipeline as app.detect_image, but AI or Not, URL fetches and Gemini
+    are awaited on the loop, JSON parsing and base64 decoding run on
+    decode_executor, and hashing and trimming run on media_executor.
+    """
+    try:
+        if not AI_OR_NOT_API_KEY:
+            return jsonify({"ok": False, "error": "Missing AI_OR_NOT_API_KEY"}), 500
+
+        # 1. Identify Content Type & Source
+        media_bytes, source_filename, is_video_type, media_url = None, "upload.jpg", False, None
+        if request.is_json:
+            # Stream the body instead of get_data(), which joins it into one
+            # bytes object on the loop thread
+            chunks = [chunk async for chunk in request.body]
+            body_path = await _run_in(media_executor, _spool_chunks, chunks)
+            media_path, source_filename, is_video_type, media_url = await _run_in(
+                decode_executor, _load_detect_body, body_path
+            )
+            if media_path:
+                media_bytes = await _run_in(media_executor, _read_spooled, media_path)
+
+        if media_url:
+            media_bytes = await _fetch_media_url(media_url)
+            source_filename = Path(media_url).name or "remote_media"
+
+        if not media_bytes:
+            return jsonify({"ok": False, "error": "No media content provided"}), 400
+
+        media_hash = await _run_in(media_executor, _sha256_bytes, media_bytes)
+
+        # 2. Cache Check
+        if media_hash in cache:
+            return jsonify({
+                **cache[media_hash]["result"],
+                "cached": True,
+                "hash": media_hash,
+                "quota": quota_manager.get_status()
+            })
+
+        # 3. Quota Guard: reserve the credit up front so concurrent requests
+        # can't all pass the check while earlier calls are still in flight
+        if not quota_manager.use_credit():
+            return jsonify({"ok": False, "error": "Quota reached", "quota": quota_manager.get_status()}), 429
+
+        media_type = "video" if is_video_type else "image"
+        charged = False
+        try:
+            # 4. Video Trimming (First 5 Seconds Only)
+            if _should_trim_video(is_video_type, source_filename):
+                media_bytes = await _run_in(media_executor, _trim_video_bytes, media_bytes)
+
+            # 5. Execute AI Detection
+            api_response = await _call_ai_detection_api_async(media_bytes, media_type, source_filename)
+            charged = True
+        finally:
+            # Refund on errors and on cancellation (client disconnect, shutdown)
+            if not charged:
+                quota_manager.refund_credit()
+        is_ai, confidence = _normalize_aiornot_response(api_response)
+
+        is_nsfw = await _check_nsfw_with_gemini_async(media_bytes, media_type)
+
+        # 6. Response Construction
+        result = _build_detect_result(is_ai, confidence, is_nsfw, media_hash, is_video_type)
+
+        # Cache with 24h TTL logic
+        cache[media_hash] = {"result": result, "timestamp": _utc_now_iso()}
+
+        return jsonify(result)
+
+    except Exception as e:
+        print(f"[AIFD] Backend Error: {str(e)}")
+        return jsonify({"ok": False, "error": str(e)}), 500
+
+@app.get("/quota")
+async def get_quota():
+    """Get current quota usage"""
+    return jsonify({
+        "ok": True,
+        "quota": quota_manager.get_status()
+    })
+
+@app.get("/cache/info")
+async def cache_info():
+    """Get cache information"""
+    return jsonify({
+        "ok": True,
+        "size": len(cache),
+        "quota": quota_manager.get_status()
+    })
+
+@app.post("/cache/clear")
+async def clear_cache_endpoint():
+    """Clear the cache (for debugging/maintenance)"""
+    cache.clear()
+    return jsonify({
+        "ok": True,
+        "message": "Cache cleared",
+        "size": len(cache)
+    })
+
+if __name__ == "__main__":
+    app.run(host="0.0.0.0", port=3500)
@@ -0,0 +1,282 @@
+"""
+The async server against the Flask one, with mockAPI.py standing in for AI or Not.
+
+Run from backend/:  python -m pytest -q tests
+"""
+import asyncio
+import base64
+import hashlib
+import random
+from urllib.parse import urlparse
+
+import httpx
+import pytest
+import requests
+from moviepy import ColorClip, VideoFileClip
+
+import app as flask_backend
+import async_app
+import mockAPI
+
+MEDIA_HOST = "media.example.com"
+IMAGE_BYTES = b"\x89PNG\r\n\x1a\n" + b"\x00" * 64
+
+
+def _image_payload(data: bytes = IMAGE_BYTES) -> dict:
+    return {"base64": "data:image/png;base64," + base64.b64encode(data).decode()}
+
+
+def _call_mock_api(path: str, body: bytes, content_type: str):
+    return mockAPI.app.test_client().post(path, data=body, headers={"Content-Type": content_type})
+
+
+def _make_video(path, duration: float) -> bytes:
+    clip = ColorClip(size=(16, 16), color=(255, 0, 0), duration=duration).with_fps(5)
+    clip.write_videofile(str(path), codec="libx264", audio=False, logger=None)
+    return path.read_bytes()
+
+
+def _video_duration(data: bytes, tmp_path) -> float:
+    path = tmp_path / "probe.mp4"
+    path.write_bytes(data)
+    with VideoFileClip(str(path)) as video:
+        return video.duration
+
+
+class Upstream:
+    """httpx transport: AI or Not -> mockAPI.py, MEDIA_HOST -> IMAGE_BYTES."""
+
+    def __init__(self):
+        self.aiornot_calls = 0
+        self.aiornot_delay = 0.0
+        self.aiornot_status = None
+
+    async def handle(self, request: httpx.Request) -> httpx.Response:
+        if request.url.host == MEDIA_HOST:
+            return httpx.Response(200, content=IMAGE_BYTES, headers={"Content-Type": "image/png"})
+
+        self.aiornot_calls += 1
+        await asyncio.sleep(self.aiornot_delay)
+        if self.aiornot_status is not None:
+            return httpx.Response(self.aiornot_status, text="upstream error")
+        if request.url.path == "/v2/video/sync":
+            # mockAPI.py only models the async video flow; reuse its /query report
+            resp = mockAPI.app.test_client().post("/query", json={"job_id": "video-sync"})
+            return httpx.Response(resp.status_code, content=resp.data, headers={"Content-Type": resp.content_type})
+        resp = _call_mock_api(request.url.path, request.read(), request.headers["Content-Type"])
+        return httpx.Response(resp.status_code, content=resp.data, headers={"Content-Type": resp.content_type})
+
+
+@pytest.fixture
+def upstream(monkeypatch):
+    upstream = Upstream()
+    monkeypatch.setattr(flask_backend, "AI_OR_NOT_API_KEY", "test-key-1234")
+    monkeypatch.setattr(async_app, "AI_OR_NOT_API_KEY", "test-key-1234")
+    monkeypatch.setattr(flask_backend, "gemini_client", None)
+    monkeypatch.setattr(async_app, "gemini_client", None)
+    monkeypatch.setattr(flask_backend.quota_manager, "limit", 10)
+    monkeypatch.setattr(flask_backend.quota_manager, "used", 0)
+    http_client = httpx.AsyncClient(transport=httpx.MockTransport(upstream.handle))
+    monkeypatch.setattr(async_app, "http_client", http_client)
+    flask_backend.cache.clear()
+    yield upstream
+    flask_backend.cache.clear()
+    asyncio.run(http_client.aclose())
+
+
+async def _detect(payload: dict):
+    client = async_app.app.test_client()
+    resp = await client.post("/detect", json=payload)
+    return resp.status_code, await resp.get_json()
+
+
+def test_detect_inline_image(upstream):
+    status, body = asyncio.run(_detect(_image_payload()))
+
+    assert status == 200
+    assert body["ok"] is True
+    assert body["media_type"] == "image"
+    assert body["hash"] == hashlib.sha256(IMAGE_BYTES).hexdigest()
+    assert isinstance(body["is_ai"], bool)
+    assert 0.0 <= body["confidence"] <= 100.0
+    assert body["nsfw"] is False
+    assert body["quota"] == {"used": 1, "remaining": 9, "limit": 10}
+    assert upstream.aiornot_calls == 1
+
+
+def test_detect_video_blob_is_trimmed(upstream, monkeypatch, tmp_path):
+    monkeypatch.setattr(flask_backend, "UPLOAD_DIR", tmp_path / "uploads")
+    video_bytes = _make_video(tmp_path / "clip.mp4", duration=7)
+
+    trimmed = []
+
+    def spy_trim(media_bytes):
+        trimmed.append(flask_backend._trim_video_bytes(media_bytes))
+        return trimmed[-1]
+
+    monkeypatch.setattr(async_app, "_trim_video_bytes", spy_trim)
+
+    payload = {"video_data": base64.b64encode(video_bytes).decode(), "isVideo": True}
+    status, body = asyncio.run(_detect(payload))
+
+    assert status == 200
+    assert body["ok"] is True
+    assert body["media_type"] == "video"
+    assert body["hash"] == hashlib.sha256(video_bytes).hexdigest()
+    assert upstream.aiornot_calls == 1
+    assert len(trimmed) == 1
+    assert _video_duration(trimmed[0], tmp_path) <= 5.1
+    assert list((tmp_path / "uploads").iterdir()) == []
+
+
+def test_detect_media_url(upstream):
+    status, body = asyncio.run(_detect({"media_url": f"https://{MEDIA_HOST}/cat.png"}))
+
+    assert status == 200
+    assert body["ok"] is True
+    assert body["hash"] == hashlib.sha256(IMAGE_BYTES).hexdigest()
+    assert upstream.aiornot_calls == 1
+
+
+def test_detect_cache_hit(upstream):
+    async def scenario():
+        first = await _detect(_image_payload())
+        second = await _detect(_image_payload())
+        return first, second
+
+    (_, first), (status, second) = asyncio.run(scenario())
+
+    assert status == 200
+    assert second["cached"] is True
+    assert second["is_ai"] == first["is_ai"]
+    assert second["quota"]["used"] == 1
+    assert upstream.aiornot_calls == 1
+
+
+def test_detect_quota_reached(upstream):
+    flask_backend.quota_manager.used = flask_backend.quota_manager.limit
+
+    status, body = asyncio.run(_detect(_image_payload()))
+
+    assert status == 429
+    assert body == {"ok": False, "error": "Quota reached", "quota": {"used": 10, "remaining": 0, "limit": 10}}
+    assert upstream.aiornot_calls == 0
+
+
+def test_detect_quota_holds_under_concurrency(upstream):
+    flask_backend.quota_manager.limit = 2
+    upstream.aiornot_delay = 0.05
+
+    async def scenario():
+        return await asyncio.gather(*(_detect(_image_payload(bytes([i]) * 32)) for i in range(5)))
+
+    statuses = sorted(status for status, _ in asyncio.run(scenario()))
+
+    assert statuses == [200, 200, 429, 429, 429]
+    assert upstream.aiornot_calls == 2
+
+
+def test_detect_refunds_quota_on_upstream_error(upstream):
+    upstream.aiornot_status = 502
+
+    status, body = asyncio.run(_detect(_image_payload()))
+
+    assert status == 500
+    assert body["ok"] is False
+    assert flask_backend.quota_manager.used == 0
+
+
+def test_detect_matches_flask_backend(upstream, monkeypatch):
+    def post_to_mock_api(url, files=None, headers=None, timeout=None):
+        field, (name, data, content_type) = next(iter(files.items()))
+        resp = mockAPI.app.test_client().post(urlparse(url).path, data={field: (data, name, content_type)})
+        result = requests.Response()
+        result.status_code = resp.status_code
+        result.reason = resp.status
+        result.url = url
+        result.headers["Content-Type"] = resp.content_type
+        result._content = resp.data
+        return result
+
+    monkeypatch.setattr(flask_backend.requests, "post", post_to_mock_api)
+
+    # mockAPI randomises verdicts; give each backend an identically seeded stream
+    monkeypatch.setattr(mockAPI, "random", random.Random(2026))
+    flask_body = flask_backend.app.test_client().post("/detect", json=_image_payload()).get_json()
+
+    flask_backend.cache.clear()
+    flask_backend.quota_manager.used = 0
+
+    monkeypatch.setattr(mockAPI, "random", random.Random(2026))
+    _, async_body = asyncio.run(_detect(_image_payload()))
+
+    assert async_body == flask_body
+
+
+def test_detect_refunds_quota_on_cancel(upstream):
+    upstream.aiornot_delay = 30
+
+    async def scenario():
+        task = asyncio.create_task(_detect(_image_payload()))
+        while upstream.aiornot_calls == 0:
+            await asyncio.sleep(0.01)
+        assert flask_backend.quota_manager.used == 1
+
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+
+    asyncio.run(scenario())
+
+    assert flask_backend.quota_manager.used == 0
+    assert flask_backend.cache == {}
+
+
+async def _async_call(method: str, path: str):
+    client = async_app.app.test_client()
+    resp = await client.open(path, method=method)
+    return resp.status_code, await resp.get_json()
+
+
+def _flask_call(method: str, path: str):
+    resp = flask_backend.app.test_client().open(path, method=method)
+    return resp.status_code, resp.get_json()
+
+
+@pytest.mark.parametrize(
+    "method, path",
+    [("GET", "/quota"), ("GET", "/health"), ("GET", "/cache/info"), ("POST", "/cache/clear")],
+)
+def test_endpoints_match_flask_backend(upstream, method, path):
+    def seed_state():
+        flask_backend.quota_manager.used = 3
+        flask_backend.cache.clear()
+        flask_backend.cache["abc"] = {"result": {"ok": True}, "timestamp": flask_backend._utc_now_iso()}
+
+    seed_state()
+    flask_status, flask_body = _flask_call(method, path)
+    seed_state()
+    async_status, async_body = asyncio.run(_async_call(method, path))
+
+    # /health stamps the current time
+    flask_body.pop("timestamp", None)
+    async_body.pop("timestamp", None)
+
+    assert async_status == flask_status == 200
+    assert async_body == flask_body
+
+
+def test_detect_malformed_json_matches_flask_backend(upstream):
+    async def post_async():
+        resp = await async_app.app.test_client().post(
+            "/detect", data=b"{not json", headers={"Content-Type": "application/json"}
+        )
+        return resp.status_code, await resp.get_json()
+
+    flask_resp = flask_backend.app.test_client().post(
+        "/detect", data=b"{not json", headers={"Content-Type": "application/json"}
+    )
+    async_status, async_body = asyncio.run(post_async())
+
+    assert async_status == flask_resp.status_code == 400
+    assert async_body == flask_resp.get_json()